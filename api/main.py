@@ -1,23 +1,38 @@
 # api/main.py
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
 import json
 import os
 import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import List, Optional, Dict, Any
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi import APIRouter, FastAPI, HTTPException, Request, Response
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel, field_validator
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.types import ASGIApp
 
+try:
+    import orjson
+except ImportError:
+    # Fallback to stdlib json if orjson is not installed
+    orjson = None
+
 # local modules
 from crawler.scraper import crawl_domain
-from extractor.nlp_pipeline import extract_entities
+from common.jsonio import json_bytes, json_loads
+from extractor.nlp_pipeline import extract_entities, warm_models
 
 # Import validators
 try:
@@ -54,12 +69,41 @@ ENTITIES_PATH = DATA_DIR / "entities.json"
 STATUS_PATH = DATA_DIR / "status.json"
 CANCEL_PATH = DATA_DIR / "cancel.flag"
 
+# -----------------------
+# Worker pool
+# -----------------------
+# Blocking crawl/extract work runs on this bounded pool so the event loop stays
+# free for /health, /results and /status while a job is running.
+EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="extractify-worker")
+# Extraction shares the NLP models and entities.json; run one at a time.
+_EXTRACT_LOCK = threading.Lock()
+# crawl-and-extract jobs truncate and rewrite pages.jsonl/entities.json; run
+# whole jobs one at a time so a newer job never clobbers a running one's files.
+_JOB_LOCK = threading.Lock()
+# Futures of fire-and-forget jobs, kept referenced until they finish.
+_BACKGROUND_JOBS: set = set()
+# status.json is read-modify-written from request handlers and from both
+# workers; serialize those updates (they also share status.json.tmp).
+_STATUS_LOCK = threading.Lock()
+
 # -----------------------
 # FastAPI app + CORS
 # -----------------------
+# orjson-backed responses when available (ORJSONResponse requires the package)
+DefaultJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """Optionally load NLP models in the background so the first extraction isn't blocked."""
+    if os.getenv("CP_PREWARM_MODELS", "0") == "1":
+        threading.Thread(target=warm_models, name="extractify-prewarm", daemon=True).start()
+    yield
+
 app = FastAPI(
     title="Extractify — The Coding Penguins Project (Deviathon 2025)",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=DefaultJSONResponse,
+    lifespan=_lifespan,
 )
 
 # Custom CORS middleware to ensure headers are always present
@@ -72,6 +116,11 @@ class CORSHeadersMiddleware(BaseHTTPMiddleware):
         response.headers["Access-Control-Allow-Headers"] = "*"
         return response
 
+# Compress larger JSON bodies (mostly /results); small responses pass through.
+# Registered innermost so it sees whole bodies rather than the re-chunked
+# stream BaseHTTPMiddleware produces, which would defeat minimum_size.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Add custom CORS middleware first
 app.add_middleware(CORSHeadersMiddleware)
 
@@ -84,6 +133,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+class APIAliasMiddleware:
+    """Serve top-level aliases (e.g. /health) by rewriting them to /api/* before routing."""
+
+    def __init__(self, app: ASGIApp, paths: frozenset) -> None:
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            scope = dict(scope, path="/api" + scope["path"])
+        await self.app(scope, receive, send)
+
 # -----------------------
 # Pydantic models
 # -----------------------
@@ -163,16 +225,19 @@ class ExtractRequest(BaseModel):
 # -----------------------
 # Helper functions
 # -----------------------
+# JSON (de)serialization goes through common.jsonio, the same helpers the
+# crawler and extractor write their data files with.
 def _read_json(path: Path) -> Any:
     """Safely read a JSON file. Returns None if file missing."""
     try:
         if not path.exists():
             return None
-        text = path.read_text(encoding="utf-8").strip()
-        if not text:
+        data = path.read_bytes().strip()
+        if not data:
             return []
-        return json.loads(text)
+        return json_loads(data)
     except json.JSONDecodeError:
+        # raised by json_loads when neither orjson nor the stdlib accepts the data
         LOG.warning("JSON decode error reading %s — returning empty list", path)
         return []
     except Exception as e:
@@ -185,7 +250,7 @@ def _write_json(path: Path, payload: Any) -> None:
     try:
         path.parent.mkdir(parents=True, exist_ok=True)
         tmp = path.with_suffix(path.suffix + ".tmp")
-        tmp.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.write_bytes(json_bytes(payload))
         tmp.replace(path)
     except Exception:
         LOG.exception("Failed to write JSON to %s", path)
@@ -193,20 +258,23 @@ def _write_json(path: Path, payload: Any) -> None:
 
 
 def _read_status() -> Dict[str, Any]:
-    try:
-        if STATUS_PATH.exists():
-            return json.loads(STATUS_PATH.read_text(encoding="utf-8"))
-    except Exception:
-        pass
-    return {"phase": "idle"}
+    data = _read_json(STATUS_PATH)
+    return data if isinstance(data, dict) else {"phase": "idle"}
 
 
-def _write_status(update: Dict[str, Any]) -> None:
+def _write_status(update: Dict[str, Any], job_id: Optional[str] = None) -> None:
+    """
+    Merge `update` into status.json. With `job_id`, the update is dropped unless
+    that job is still the current one, so a superseded job can't overwrite it.
+    """
     try:
-        STATUS_PATH.parent.mkdir(parents=True, exist_ok=True)
-        current = _read_status()
-        current.update(update)
-        STATUS_PATH.write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+        with _STATUS_LOCK:
+            current = _read_status()
+            if job_id is not None and current.get("job_id") != job_id:
+                LOG.info("Dropping status update from superseded job %s", job_id)
+                return
+            current.update(update)
+            _write_json(STATUS_PATH, current)
     except Exception:
         LOG.warning("Failed to write status.json")
 
@@ -250,21 +318,16 @@ def _do_extract(payload: ExtractRequest) -> Any:
     try:
         # NOTE: extractor.extract_entities historically has different signatures depending on implementation.
         # To remain compatible we only pass the stable, core args. If your extractor supports min_score, update here.
-        out = extract_entities(
-            pages_path=str(PAGES_PATH),
-            entities_path=str(ENTITIES_PATH),
-            keywords=payload.keywords or [],
-            target=payload.target or "auto",
-            cancel_path=str(CANCEL_PATH),
-        )
-        # write output if extractor returned a serializable result
-        try:
-            if isinstance(out, dict) and "entities" in out:
-                _write_json(ENTITIES_PATH, out)
-            elif isinstance(out, list):
-                _write_json(ENTITIES_PATH, out)
-        except Exception:
-            LOG.warning("Could not persist extraction output to %s", ENTITIES_PATH)
+        with _EXTRACT_LOCK:
+            out = extract_entities(
+                pages_path=str(PAGES_PATH),
+                entities_path=str(ENTITIES_PATH),
+                keywords=payload.keywords or [],
+                target=payload.target or "auto",
+                cancel_path=str(CANCEL_PATH),
+            )
+        # extract_entities persists entities.json itself (incrementally, per page);
+        # re-serializing the whole result here would only repeat that O(N) write.
         return out
     except HTTPException:
         # re-raise HTTP errors from extractor
@@ -274,18 +337,80 @@ def _do_extract(payload: ExtractRequest) -> Any:
         raise
 
 
-def _do_results() -> List[Dict[str, Any]]:
+# Parsed /results payload, keyed on entities.json's (st_mtime_ns, st_size) so
+# UI polling only re-parses the file after it actually changed.
+# The serialized body is cached alongside, so unchanged polls skip JSON entirely.
+# The entry is an immutable (key, value, body) tuple that is only ever replaced
+# whole, so concurrent requests can't pair one file version's body with another's key.
+_RESULTS_CACHE: tuple = (None, [], None)
+
+
+def _results_key() -> Optional[tuple]:
+    try:
+        st = ENTITIES_PATH.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _results_etag(key: Optional[tuple]) -> str:
+    return '"%s"' % hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+
+
+def _results_entry() -> tuple:
+    """Current (key, value, body) cache entry, re-reading entities.json if it changed."""
+    global _RESULTS_CACHE
+    # stat before reading: if the file changes mid-read the next call sees a new key
+    key = _results_key()
+    entry = _RESULTS_CACHE
+    if key is not None and key == entry[0]:
+        return entry
+
     data = _read_json(ENTITIES_PATH)
-    if data is None:
-        return []
     if isinstance(data, dict) and "entities" in data:
-        return data["entities"]
-    if isinstance(data, list):
-        return data
-    return []
+        value = data["entities"]
+    elif isinstance(data, list):
+        value = data
+    else:
+        value = []
+    entry = (key, value, None)
+    _RESULTS_CACHE = entry
+    return entry
 
 
-def _do_crawl_and_extract(payload: CrawlRequest) -> Dict[str, Any]:
+def _do_results() -> List[Dict[str, Any]]:
+    return _results_entry()[1]
+
+
+def _results_body() -> tuple:
+    """(cache key, compact JSON bytes) for the current entities."""
+    global _RESULTS_CACHE
+    entry = _results_entry()
+    key, value, body = entry
+    if body is None:
+        # serialized from this entry's own value, so body and key always match
+        body = json_bytes(value, pretty=False)
+        if _RESULTS_CACHE is entry:
+            _RESULTS_CACHE = (key, value, body)
+    return key, body
+
+
+def _do_crawl_and_extract(payload: CrawlRequest, job_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Crawl then extract under _JOB_LOCK; status updates are tagged with `job_id`
+    (see _write_status). A job superseded or cancelled while it waited for the
+    lock returns without touching the data files.
+    """
+    with _JOB_LOCK:
+        if job_id is not None:
+            status = _read_status()
+            if status.get("job_id") != job_id or status.get("phase") == "cancelled":
+                LOG.info("Skipping superseded or cancelled job %s", job_id)
+                return {"skipped": 1}
+        return _crawl_and_extract_locked(payload, job_id)
+
+
+def _crawl_and_extract_locked(payload: CrawlRequest, job_id: Optional[str]) -> Dict[str, Any]:
     LOG.info("crawl-and-extract start: %s", payload.domain)
     # Clear previous crawl and extraction data
     try:
@@ -308,36 +433,27 @@ def _do_crawl_and_extract(payload: CrawlRequest) -> Dict[str, Any]:
             "completed_at": None,
             "cancelled_at": None,
             "error": None,
-        })
+        }, job_id)
         crawl_result = _do_crawl(payload)
     except Exception as e:
         LOG.exception("crawl part failed: %s", e)
-        _write_status({"phase": "error", "error": f"Crawl error: {e}"})
+        _write_status({"phase": "error", "error": f"Crawl error: {e}"}, job_id)
         raise HTTPException(status_code=500, detail=f"Crawl error: {e}")
 
     try:
         # If cancelled during crawl, do not proceed to extract
         if CANCEL_PATH.exists():
-            _write_status({"phase": "cancelled"})
+            _write_status({"phase": "cancelled"}, job_id)
             extract_result = {"entities": [], "entities_count": 0, "cancelled": 1}
         else:
-            _write_status({"phase": "extracting", "pages_scanned": crawl_result.get("pages_scanned", 0)})
+            _write_status({"phase": "extracting", "pages_scanned": crawl_result.get("pages_scanned", 0)}, job_id)
             extract_payload = ExtractRequest(keywords=payload.keywords or [], target="auto")
             extract_result = _do_extract(extract_payload)
     except Exception as e:
         LOG.exception("extract part failed: %s", e)
-        _write_status({"phase": "error", "error": f"Extract error: {e}"})
+        _write_status({"phase": "error", "error": f"Extract error: {e}"}, job_id)
         raise HTTPException(status_code=500, detail=f"Extract error: {e}")
 
-    # persist entities if shape ok
-    try:
-        if isinstance(extract_result, dict) and "entities" in extract_result:
-            _write_json(ENTITIES_PATH, extract_result)
-        elif isinstance(extract_result, list):
-            _write_json(ENTITIES_PATH, extract_result)
-    except Exception:
-        LOG.warning("Failed to persist entities.json after crawl-and-extract")
-
     LOG.info(
         "crawl-and-extract done: pages=%s entities=%s",
         crawl_result.get("pages_scanned"),
@@ -352,11 +468,11 @@ def _do_crawl_and_extract(payload: CrawlRequest) -> Dict[str, Any]:
                 "phase": "completed",
                 "completed_at": datetime.now(timezone.utc).isoformat(),
                 "entities_count": len(ents),
-            })
+            }, job_id)
         else:
             _write_status({
                 "entities_count": len(ents),
-            })
+            }, job_id)
     except Exception:
         pass
 
@@ -364,8 +480,12 @@ def _do_crawl_and_extract(payload: CrawlRequest) -> Dict[str, Any]:
 
 
 # -----------------------
-# Routes (both /api/* and top-level duplicates)
+# Routes
 # -----------------------
+# Handlers on `router` live under /api; APIAliasMiddleware also serves them at
+# the top level for non-/api clients without registering duplicate routes.
+router = APIRouter()
+
 @app.get("/", include_in_schema=False)
 def root() -> HTMLResponse:
         """Simple landing page to avoid 404 at service root."""
@@ -403,8 +523,8 @@ def root() -> HTMLResponse:
 def api_root() -> RedirectResponse:
         """Redirect bare /api to the interactive docs for convenience."""
         return RedirectResponse(url="/docs")
-@app.get("/api/health")
-def api_health() -> Dict[str, Any]:
+@router.get("/health")
+def health() -> Dict[str, Any]:
     return {
         "status": "ok",
         "app": "Extractify — Entity Extractor",
@@ -414,53 +534,58 @@ def api_health() -> Dict[str, Any]:
     }
 
 
-@app.get("/health")
-def health() -> Dict[str, Any]:
-    # duplicate top-level health for non-/api clients
-    return api_health()
+async def _run_in_executor(fn, *args) -> Any:
+    """Run blocking work on EXECUTOR without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(EXECUTOR, functools.partial(fn, *args))
+
+
+def _job_done(fut: asyncio.Future) -> None:
+    _BACKGROUND_JOBS.discard(fut)
+    if not fut.cancelled() and fut.exception() is not None:
+        # failures are already recorded in status.json; just log them here
+        LOG.warning("background job failed: %s", fut.exception())
+
+
+def _submit_background(fn, *args) -> None:
+    """Start blocking work on EXECUTOR without awaiting it (must run on the event loop)."""
+    fut = asyncio.get_running_loop().run_in_executor(EXECUTOR, functools.partial(fn, *args))
+    _BACKGROUND_JOBS.add(fut)
+    fut.add_done_callback(_job_done)
 
 
 # Crawl
-@app.post("/api/crawl")
-def api_crawl(payload: CrawlRequest) -> Dict[str, Any]:
+@router.post("/crawl")
+async def crawl(payload: CrawlRequest) -> Dict[str, Any]:
     try:
-        return _do_crawl(payload)
+        return await _run_in_executor(_do_crawl, payload)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/crawl")
-def crawl(payload: CrawlRequest) -> Dict[str, Any]:
-    return api_crawl(payload)
-
-
 # Extract
-@app.post("/api/extract")
-def api_extract(payload: ExtractRequest) -> Dict[str, Any]:
+@router.post("/extract")
+async def extract(payload: ExtractRequest) -> Dict[str, Any]:
     try:
-        return _do_extract(payload)
+        return await _run_in_executor(_do_extract, payload)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/extract")
-def extract(payload: ExtractRequest) -> Dict[str, Any]:
-    return api_extract(payload)
-
-
 # Results
-@app.get("/api/results")
-def api_results() -> List[Dict[str, Any]]:
-    return _do_results()
-
-
-@app.get("/results")
-def results() -> List[Dict[str, Any]]:
-    return api_results()
+@router.get("/results", response_model=List[Dict[str, Any]])
+def results(request: Request) -> Response:
+    """Current entities; supports If-None-Match so unchanged polls get a 304."""
+    etag = _results_etag(_results_key())
+    inm = request.headers.get("if-none-match")
+    if inm and etag in [t.strip() for t in inm.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    key, body = _results_body()
+    return Response(content=body, media_type="application/json", headers={"ETag": _results_etag(key)})
 
 
 # Status & Cancel
@@ -469,6 +594,15 @@ def api_status() -> Dict[str, Any]:
     return _read_status()
 
 
+@app.get("/api/jobs/{job_id}")
+def api_job(job_id: str) -> Dict[str, Any]:
+    """Status of a crawl-and-extract job; only the most recent job is tracked."""
+    status = _read_status()
+    if status.get("job_id") != job_id:
+        raise HTTPException(status_code=404, detail="Unknown or superseded job id")
+    return status
+
+
 @app.post("/api/cancel")
 def api_cancel() -> Dict[str, Any]:
     try:
@@ -481,26 +615,38 @@ def api_cancel() -> Dict[str, Any]:
 
 
 # Crawl-and-extract convenience endpoint
-@app.post("/api/crawl-and-extract")
-def api_crawl_and_extract(payload: CrawlRequest, background_tasks: BackgroundTasks) -> Dict[str, Any]:
+@router.post("/crawl-and-extract")
+async def crawl_and_extract(payload: CrawlRequest) -> Dict[str, Any]:
     """Start crawl-and-extract as a background task and return immediately."""
     LOG.info("crawl-and-extract request received: %s", payload.domain)
     
-    # Clear previous data immediately
-    try:
-        for path in [PAGES_PATH, ENTITIES_PATH]:
-            try:
-                path.write_text("", encoding="utf-8")
-            except Exception:
-                pass
-    except Exception as e:
-        LOG.warning("Failed to clear data files: %s", e)
-    
-    # Run crawl-and-extract in background
-    background_tasks.add_task(_do_crawl_and_extract, payload)
+    # Only the newest job is tracked: ask a running one to stop early. The new
+    # job clears the data files itself once it holds _JOB_LOCK.
+    if _BACKGROUND_JOBS:
+        try:
+            CANCEL_PATH.parent.mkdir(parents=True, exist_ok=True)
+            CANCEL_PATH.write_text("1", encoding="utf-8")
+        except Exception as e:
+            LOG.warning("Failed to stop the running job: %s", e)
+
+    # Run crawl-and-extract in background; the job id lets clients poll /api/jobs/{job_id}
+    job_id = uuid.uuid4().hex
+    # start from a clean record so the new job never reports the previous job's counts
+    _write_status({
+        "job_id": job_id,
+        "phase": "queued",
+        "domain": payload.domain,
+        "pages_scanned": 0,
+        "entities_count": 0,
+        "completed_at": None,
+        "cancelled_at": None,
+        "error": None,
+    })
+    _submit_background(_do_crawl_and_extract, payload, job_id)
     
     return {
         "status": "started",
+        "job_id": job_id,
         "message": "Crawl and extraction started in background",
         "domain": payload.domain,
         "max_pages": payload.max_pages,
@@ -508,6 +654,20 @@ def api_crawl_and_extract(payload: CrawlRequest, background_tasks: BackgroundTas
     }
 
 
-@app.post("/crawl-and-extract")
-def crawl_and_extract(payload: CrawlRequest, background_tasks: BackgroundTasks) -> Dict[str, Any]:
-    return api_crawl_and_extract(payload, background_tasks)
+app.include_router(router, prefix="/api")
+app.add_middleware(APIAliasMiddleware, paths=frozenset(r.path for r in router.routes))
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Single worker on purpose: job state, the worker pool and the results cache
+    # are per-process. uvloop/httptools are picked up by loop/http="auto".
+    uvicorn.run(
+        "api.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        loop="auto",
+        http="auto",
+        backlog=2048,
+    )
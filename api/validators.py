@@ -6,6 +6,10 @@ import re
 from typing import List
 from urllib.parse import urlparse
 
+# Built once at import; validate_keywords checks every keyword against these.
+_SUSPICIOUS_CHARS = frozenset('<>{}()[]\'"\\;')
+_WS_RE = re.compile(r'\s+')
+
 
 class ValidationError(Exception):
     """Custom validation error."""
@@ -71,14 +75,14 @@ def validate_keywords(keywords: List[str], max_keywords: int = 50) -> List[str]:
             continue
         
         # Remove excessive whitespace and sanitize
-        kw = ' '.join(kw.strip().split())
+        kw = _WS_RE.sub(' ', kw).strip()
         
         # Skip empty or too long keywords
         if not kw or len(kw) > 100:
             continue
         
         # Skip keywords with suspicious patterns (SQL injection, XSS attempts)
-        if re.search(r'[<>{}()\[\]\'\"\\;]', kw):
+        if not _SUSPICIOUS_CHARS.isdisjoint(kw):
             continue
         
         sanitized.append(kw)
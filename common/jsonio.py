@@ -0,0 +1,47 @@
+# common/jsonio.py
+"""
+JSON helpers shared by the crawler (writes pages.jsonl), the extractor (writes
+entities.json) and the API (reads both back, writes status.json), so writers
+and reader accept the same input.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    # Fallback to stdlib json if orjson is not installed
+    orjson = None
+
+# Data files are only read back by the API; pretty-print them for debugging only.
+PRETTY_JSON = os.getenv("CP_PRETTY_JSON", "0") == "1"
+
+
+def json_bytes(payload: Any, pretty: bool = PRETTY_JSON) -> bytes:
+    """Serialize payload to UTF-8 JSON bytes (orjson when available)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0))
+        except TypeError:
+            # e.g. lone surrogates, which orjson refuses to encode
+            pass
+    # errors="replace" turns lone surrogates into "?", so the output is always
+    # valid UTF-8 that any strict reader (orjson included) accepts
+    return json.dumps(payload, ensure_ascii=False, indent=2 if pretty else None).encode("utf-8", errors="replace")
+
+
+def json_loads(data: bytes | str) -> Any:
+    """
+    Parse JSON (orjson when available). Falls back to the stdlib parser for input
+    orjson rejects but json.dumps can produce, e.g. escaped lone surrogates.
+    Raises json.JSONDecodeError if neither accepts it.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
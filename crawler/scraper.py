@@ -1,21 +1,40 @@
 # crawler/scraper.py
 from __future__ import annotations
 
-import json
+import codecs
 import re
+import threading
 import time
 import logging
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Set, Dict, Any, List, Optional
+from typing import Set, Dict, Any, List, Optional, Union
 import os
 from urllib.parse import urljoin, urlparse, urldefrag
 
 import requests
 from requests.adapters import HTTPAdapter, Retry
-from bs4 import BeautifulSoup
+from requests.utils import get_encoding_from_headers
+from bs4 import BeautifulSoup, SoupStrainer
 from urllib import robotparser
 
+from common.jsonio import json_bytes
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    # Fallback to BeautifulSoup-only text extraction if lxml is not installed
+    lxml = None
+
+# BeautifulSoup tree builder: libxml2 when available, pure-Python otherwise
+_BS4_PARSER = "lxml" if lxml is not None else "html.parser"
+# link extraction only needs <a href> elements; skip building the rest of the tree
+_LINKS_ONLY = SoupStrainer("a", href=True)
+# compiled once; evaluated per page by _parse_page
+_HREF_XPATH = etree.XPath("//a/@href") if lxml is not None else None
+
 LOG = logging.getLogger("penguins.crawler")
 LOG.setLevel(logging.INFO)
 
@@ -24,6 +43,8 @@ LOG.setLevel(logging.INFO)
 #   CP_REQUEST_DELAY_MS   -> delay between requests to same host (default 300ms)
 #   CP_MAX_RETRIES        -> HTTP retries (default 2)
 #   CP_TIMEOUT_SEC        -> per-request timeout (default 25)
+#   CP_CRAWL_CONCURRENCY  -> pages fetched in parallel per step (default 1 = sequential)
+#   CP_MAX_HTML_BYTES     -> read at most this many bytes of a page body (default 5 MiB)
 
 def _should_ignore_robots() -> bool:
     import os
@@ -44,6 +65,16 @@ def _max_retries() -> int:
     try: return int(os.getenv("CP_MAX_RETRIES", "2"))
     except: return 2
 
+def _max_html_bytes() -> int:
+    try: return max(1, int(os.getenv("CP_MAX_HTML_BYTES", str(5 * 1024 * 1024))))
+    except: return 5 * 1024 * 1024
+
+def _crawl_concurrency() -> int:
+    try: return max(1, int(os.getenv("CP_CRAWL_CONCURRENCY", "1")))
+    except: return 1
+
+USER_AGENT = "TheCodingPenguinsBot/1.1 (+https://localhost)"
+
 @dataclass
 class Page:
     url: str
@@ -61,17 +92,63 @@ def _normalize_url(base_url: str, link: str) -> Optional[str]:
     except Exception:
         return None
 
-def _same_site(u: str, root: str) -> bool:
+def _same_site(u: str, root_netloc: str) -> bool:
+    """root_netloc is the crawl root's lowercased netloc, parsed once per crawl."""
     try:
-        return urlparse(u).netloc.lower() == urlparse(root).netloc.lower()
+        return urlparse(u).netloc.lower() == root_netloc
     except Exception:
         return False
 
-def _extract_links(base_url: str, html: str) -> List[str]:
-    soup = BeautifulSoup(html, "html.parser")
+def _soup(html: Union[str, bytes], encoding: Optional[str] = None, **kwargs) -> BeautifulSoup:
+    # from_encoding only applies to (and is only accepted quietly for) bytes input
+    if encoding and isinstance(html, bytes):
+        kwargs["from_encoding"] = encoding
+    return BeautifulSoup(html, _BS4_PARSER, **kwargs)
+
+# In-document charset declarations that libxml2 honours on its own
+_DOC_CHARSET_RE = re.compile(rb"<meta[^>]+charset\s*=|<\?xml[^>]+encoding\s*=", re.I)
+_BOMS = (codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+def _undeclared_encoding(html: bytes) -> Optional[str]:
+    """
+    Charset for bytes whose response declared none. None when the document
+    declares one itself (<meta>, XML declaration, BOM); otherwise UTF-8 if the
+    bytes decode as UTF-8, since libxml2 would fall back to Latin-1.
+    """
+    head = html[:4096]
+    if head.startswith(_BOMS) or _DOC_CHARSET_RE.search(head):
+        return None
+    try:
+        # incremental with final=False: a body cut off mid-character still counts
+        codecs.getincrementaldecoder("utf-8")().decode(html, final=False)
+    except UnicodeDecodeError:
+        return None
+    return "utf-8"
+
+def _lxml_tree(html: Union[str, bytes], encoding: Optional[str] = None):
+    """lxml.html tree; bytes are decoded by libxml2 (declared charset, else <meta>, else UTF-8)."""
+    if isinstance(html, bytes):
+        encoding = encoding or _undeclared_encoding(html)
+        if encoding:
+            return lxml.html.fromstring(html, parser=_lxml_parser(encoding))
+    return lxml.html.fromstring(html)
+
+# lxml parsers lock for the whole parse, so each crawl thread keeps its own
+_LXML_PARSERS = threading.local()
+
+def _lxml_parser(encoding: str):
+    parsers = getattr(_LXML_PARSERS, "by_encoding", None)
+    if parsers is None:
+        parsers = _LXML_PARSERS.by_encoding = {}
+    parser = parsers.get(encoding)
+    if parser is None:
+        parser = parsers[encoding] = lxml.html.HTMLParser(encoding=encoding)
+    return parser
+
+def _extract_links(base_url: str, html: Union[str, bytes], encoding: Optional[str] = None) -> List[str]:
+    soup = _soup(html, encoding, parse_only=_LINKS_ONLY)
     links: List[str] = []
-    for a in soup.find_all("a"):
-        href = a.get("href")
+    for href in dict.fromkeys(a.get("href") for a in soup.find_all("a")):
         if not href:
             continue
         u = _normalize_url(base_url, href)
@@ -79,13 +156,59 @@ def _extract_links(base_url: str, html: str) -> List[str]:
             links.append(u)
     return links
 
-def _clean_text(html: str) -> str:
-    soup = BeautifulSoup(html, "html.parser")
+def _text_from_tree(tree) -> str:
+    """Visible text of an lxml tree; strips script/style/noscript/comments in place."""
+    for el in tree.iter("script", "style", "noscript", etree.Comment):
+        # keep the tail as a separate word once the element is gone
+        if el.tail:
+            el.tail = " " + el.tail
+    etree.strip_elements(tree, "script", "style", "noscript", etree.Comment, with_tail=False)
+    # itertext mirrors get_text(separator=" ")
+    return " ".join(" ".join(tree.itertext()).split())
+
+def _parse_page(base_url: str, html: Union[str, bytes], encoding: Optional[str] = None) -> tuple[Optional[str], str, List[str]]:
+    """
+    (title, text, links) for a page from a single lxml parse.
+    Falls back to the BeautifulSoup helpers when lxml is unavailable or rejects the input.
+    """
+    if lxml is not None:
+        try:
+            tree = _lxml_tree(html, encoding)
+            raw_title = tree.findtext(".//title")
+            title = raw_title.strip() if raw_title else None
+            links = []
+            # nav bars and footers repeat hrefs; normalize each distinct one once
+            for href in dict.fromkeys(_HREF_XPATH(tree)):
+                u = _normalize_url(base_url, href) if href else None
+                if u:
+                    links.append(u)
+            # text last: it mutates the tree
+            return title, _text_from_tree(tree), links
+        except (ValueError, LookupError, etree.ParserError):
+            pass
+    title = None
+    try:
+        soup = _soup(html, encoding)
+        if soup.title and soup.title.string:
+            title = soup.title.string.strip()
+    except Exception:
+        pass
+    return title, _clean_text(html, encoding), _extract_links(base_url, html, encoding)
+
+def _clean_text(html: Union[str, bytes], encoding: Optional[str] = None) -> str:
+    if lxml is not None:
+        try:
+            return _text_from_tree(_lxml_tree(html, encoding))
+        except (ValueError, LookupError, etree.ParserError):
+            # empty documents, str input carrying an XML encoding declaration,
+            # or an unknown declared charset
+            pass
+    soup = _soup(html, encoding)
     for tag in soup(["script", "style", "noscript"]):
         tag.decompose()
     text = soup.get_text(separator=" ", strip=True)
     # collapse whitespace
-    return re.sub(r"\s+", " ", text)
+    return " ".join(text.split())
 
 def _session_with_retries() -> requests.Session:
     s = requests.Session()
@@ -95,40 +218,129 @@ def _session_with_retries() -> requests.Session:
         status_forcelist=[429, 500, 502, 503, 504],
         allowed_methods=["GET", "HEAD"]
     )
-    adapter = HTTPAdapter(max_retries=retries, pool_connections=10, pool_maxsize=10)
+    # Every crawl worker may hold a connection to the same host at once
+    pool = max(10, _crawl_concurrency())
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=pool, pool_maxsize=pool)
     s.mount("http://", adapter)
     s.mount("https://", adapter)
     return s
 
-def _fetch(session: requests.Session, url: str, timeout: Optional[int] = None) -> Optional[requests.Response]:
+# One pooled session per process, so repeated crawls of the same host reuse
+# keep-alive connections and TLS sessions instead of handshaking again.
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+def _get_session() -> requests.Session:
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                _SESSION = _session_with_retries()
+    return _SESSION
+
+def _fetch(session: requests.Session, url: str, timeout: Optional[int] = None) -> Optional[tuple]:
+    """
+    (raw HTML bytes, charset declared in Content-Type or None) for url, or None
+    for non-200 / non-HTML responses. The body is streamed and cut off at
+    CP_MAX_HTML_BYTES, so huge pages can't blow up memory. Decoding is left to
+    the parser, which also honours <meta charset> when the header has none.
+    """
     try:
         r = session.get(
             url,
             timeout=timeout or _timeout_sec(),
             headers={
-                "User-Agent": "TheCodingPenguinsBot/1.1 (+https://localhost)",
+                "User-Agent": USER_AGENT,
                 "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
             },
+            stream=True,
         )
-        if r.status_code == 200 and "text/html" in r.headers.get("Content-Type", ""):
-            return r
-        return None
+        try:
+            # checked before reading, so non-HTML bodies are never downloaded
+            if r.status_code != 200 or "text/html" not in r.headers.get("Content-Type", ""):
+                return None
+            cap = _max_html_bytes()
+            buf = bytearray()
+            for chunk in r.iter_content(chunk_size=65536):
+                buf += chunk
+                if len(buf) >= cap:
+                    LOG.info("Truncating %s at %s bytes", url, cap)
+                    del buf[cap:]
+                    break
+            content_type = r.headers.get("Content-Type", "")
+            declared = get_encoding_from_headers(r.headers) if "charset" in content_type.lower() else None
+            return bytes(buf), declared
+        finally:
+            r.close()
     except requests.RequestException:
         return None
 
+# robots.txt parsers per scheme://netloc, with fetch time; None means "could not read"
+_ROBOTS_CACHE: Dict[str, tuple] = {}
+_ROBOTS_TTL_SEC = 3600
+_ROBOTS_LOCK = threading.Lock()
+
+def _read_robots(robots_url: str) -> robotparser.RobotFileParser:
+    """
+    Fetch robots.txt over the shared pooled session and parse it. Status
+    handling follows RobotFileParser.read() (401/403 -> disallow all, other 4xx
+    -> allow all, 5xx -> treat as unreadable, i.e. disallow), with one stricter
+    case: the session retries 429, and a host that keeps answering 429 (or 5xx)
+    until retries run out is disallowed, where the stdlib would allow all on 429.
+    """
+    rp = robotparser.RobotFileParser(robots_url)
+    try:
+        r = _get_session().get(robots_url, timeout=_timeout_sec(), headers={"User-Agent": USER_AGENT})
+    except requests.exceptions.RetryError:
+        # server kept answering 429/5xx
+        rp.disallow_all = True
+        return rp
+    if r.status_code in (401, 403):
+        rp.disallow_all = True
+    elif 400 <= r.status_code < 500:
+        rp.allow_all = True
+    elif r.status_code < 400:
+        rp.parse(r.text.splitlines())
+    else:
+        rp.disallow_all = True
+    return rp
+
+def _robots_parser(root: str) -> Optional[robotparser.RobotFileParser]:
+    parsed = urlparse(root)
+    key = f"{parsed.scheme}://{parsed.netloc}"
+    cached = _ROBOTS_CACHE.get(key)
+    if cached and time.time() - cached[0] < _ROBOTS_TTL_SEC:
+        return cached[1]
+    with _ROBOTS_LOCK:
+        cached = _ROBOTS_CACHE.get(key)
+        if cached and time.time() - cached[0] < _ROBOTS_TTL_SEC:
+            return cached[1]
+        try:
+            rp = _read_robots(f"{key}/robots.txt")
+        except Exception:
+            rp = None
+        _ROBOTS_CACHE[key] = (time.time(), rp)
+        return rp
+
 def _robots_allowed(root: str, url: str) -> bool:
     if _should_ignore_robots():
         return True
+    rp = _robots_parser(root)
+    if rp is None:
+        return True
     try:
-        rp = robotparser.RobotFileParser()
-        parsed = urlparse(root)
-        robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
-        rp.set_url(robots_url)
-        rp.read()
         return rp.can_fetch("*", url)
     except Exception:
         return True
 
+def _fetch_and_parse(session: requests.Session, url: str) -> Optional[tuple]:
+    """(title, text, links) for url, or None if it could not be fetched as HTML."""
+    fetched = _fetch(session, url)
+    if fetched is None:
+        return None
+    body, encoding = fetched
+    return _parse_page(url, body, encoding)
+
 # 🔎 Hints to PRIORITIZE likely people/roles pages (explore sooner, don’t hard filter)
 PRIORITY_HINTS = re.compile(
     r"(team|people|staff|faculty|mentor|mentors|about|leadership|profile|instructor|directory|careers|jobs)",
@@ -149,78 +361,107 @@ def crawl_domain(
     """
     start = time.time()
     root = domain.rstrip("/")
-    seen: Set[str] = set()
+    root_netloc = urlparse(root).netloc.lower()
+    seen: Set[str] = set()          # visited (popped) URLs; drives the soft stop
+    enqueued: Set[str] = {root}     # ever queued at the back
+    boosted: Set[str] = set()       # ever queued at the front
     queue = deque([(root, 0)])
-    pages: List[Page] = []
+    # pages go straight to out_path; only a count and the first few URLs stay in memory
+    pages_count = 0
+    sample_urls: List[str] = []
 
-    session = _session_with_retries()
+    session = _get_session()
     delay = _delay_ms() / 1000.0
     kw = [k.strip().lower() for k in (keywords or []) if k and k.strip()]
 
+    # Optional parallel fetching: each step takes up to `workers` URLs off the
+    # frontier and downloads them together; the politeness delay applies per step.
+    workers = _crawl_concurrency()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crawl-fetch") if workers > 1 else None
+
     # Prepare output file for incremental writes
     # Clear/overwrite file and stream each page as JSONL as soon as it's fetched
-    f = open(out_path, "w", encoding="utf-8")
+    # Large write buffer, flushed at most once a second rather than after every page
+    f = open(out_path, "wb", buffering=1 << 20)
+    last_flush = time.monotonic()
     try:
-        while queue and len(pages) < max_pages:
+        while queue and pages_count < max_pages:
             # cooperative cancellation
             if cancel_path and os.path.exists(cancel_path):
                 LOG.info("Cancel flag detected, stopping crawl early")
                 break
-            url, depth = queue.popleft()
-            if url in seen:
-                continue
-            seen.add(url)
 
-            if depth > max_depth:
-                continue
-            if not _same_site(url, root):
-                continue
-            if not _robots_allowed(root, url):
-                continue
+            batch: List[tuple] = []
+            while queue and len(batch) < min(workers, max_pages - pages_count):
+                url, depth = queue.popleft()
+                if url in seen:
+                    continue
+                seen.add(url)
 
-            resp = _fetch(session, url)
-            if not resp:
+                if depth > max_depth:
+                    continue
+                if not _same_site(url, root_netloc):
+                    continue
+                if not _robots_allowed(root, url):
+                    continue
+                batch.append((url, depth))
+            if not batch:
                 continue
 
-            html = resp.text
-            title = None
-            try:
-                soup = BeautifulSoup(html, "html.parser")
-                if soup.title and soup.title.string:
-                    title = soup.title.string.strip()
-            except Exception:
-                pass
-
-            text = _clean_text(html)
-            page = Page(url=url, title=title, text=text)
-            pages.append(page)
-
-            # write this page immediately (incremental persistence)
-            try:
-                f.write(json.dumps({"url": page.url, "title": page.title, "text": page.text}, ensure_ascii=False) + "\n")
-                f.flush()
-            except Exception:
-                # don't crash the crawler on IO hiccups
-                LOG.warning("Failed to append page to %s", out_path)
-
-            # ✅ PRIORITIZE relevant links; don't block exploration
-            body_low = ((title or "") + " " + text[:4000]).lower()
-            for link in _extract_links(url, html):
-                if link in seen or not _same_site(link, root):
+            # parsing happens in the fetch workers too; lxml releases the GIL while parsing
+            if pool is not None:
+                parsed = list(pool.map(lambda item: _fetch_and_parse(session, item[0]), batch))
+            else:
+                parsed = [_fetch_and_parse(session, batch[0][0])]
+
+            fetched = 0
+            for (url, depth), result in zip(batch, parsed):
+                if not result:
                     continue
+                fetched += 1
+
+                title, text, links = result
+                page = Page(url=url, title=title, text=text)
+                pages_count += 1
+                if len(sample_urls) < 5:
+                    sample_urls.append(page.url)
+
+                # write this page immediately (incremental persistence)
+                try:
+                    f.write(json_bytes({"url": page.url, "title": page.title, "text": page.text}, pretty=False) + b"\n")
+                    if time.monotonic() - last_flush >= 1.0:
+                        f.flush()
+                        last_flush = time.monotonic()
+                except Exception:
+                    # don't crash the crawler on IO hiccups
+                    LOG.warning("Failed to append page to %s", out_path)
 
-                prioritized = False
-                if PRIORITY_HINTS.search(link):
-                    prioritized = True
-                elif kw and any(k in link.lower() for k in kw):
-                    prioritized = True
-                elif kw and any(k in body_low for k in kw):
-                    prioritized = True
+                # ✅ PRIORITIZE relevant links; don't block exploration
+                body_low = ((title or "") + " " + text[:4000]).lower()
+                for link in links:
+                    if link in seen or not _same_site(link, root_netloc):
+                        continue
 
-                if prioritized:
-                    queue.appendleft((link, depth + 1))   # explore sooner
-                else:
-                    queue.append((link, depth + 1))
+                    prioritized = False
+                    if PRIORITY_HINTS.search(link):
+                        prioritized = True
+                    elif kw and any(k in link.lower() for k in kw):
+                        prioritized = True
+                    elif kw and any(k in body_low for k in kw):
+                        prioritized = True
+
+                    # each URL enters the queue at most once per end; a link already
+                    # waiting at the back can still be boosted to the front once
+                    if prioritized:
+                        if link not in boosted:
+                            boosted.add(link)
+                            queue.appendleft((link, depth + 1))   # explore sooner
+                    elif link not in enqueued and link not in boosted:
+                        enqueued.add(link)
+                        queue.append((link, depth + 1))
+
+            if not fetched:
+                continue
 
             if delay > 0:
                 time.sleep(delay)
@@ -233,13 +474,15 @@ def crawl_domain(
             f.close()
         except Exception:
             pass
+        if pool is not None:
+            pool.shutdown(wait=False)
 
     elapsed = round(time.time() - start, 2)
-    LOG.info("Crawl done: %s pages, elapsed=%ss -> %s", len(pages), elapsed, out_path)
+    LOG.info("Crawl done: %s pages, elapsed=%ss -> %s", pages_count, elapsed, out_path)
     return {
         "domain": root,
-        "pages_scanned": len(pages),
-        "sample_urls": [p.url for p in pages[:5]],
+        "pages_scanned": pages_count,
+        "sample_urls": sample_urls,
         "elapsed": elapsed,
         "used_fallback": 0,
         "cancelled": 1 if (cancel_path and os.path.exists(cancel_path)) else 0,
@@ -4,34 +4,96 @@ from __future__ import annotations
 import json
 import os
 import re
-from typing import List, Dict, Iterable, Optional
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import List, Dict, Iterable, Iterator, Optional
 import os
 
+from common.jsonio import json_bytes, json_loads
+
 # ---------------- NLP setup ----------------
 import spacy
 
-# Load spaCy (download once if missing)
-try:
-    nlp = spacy.load("en_core_web_sm")
-except Exception:
-    from spacy.cli import download
-    download("en_core_web_sm")
-    nlp = spacy.load("en_core_web_sm")
-
-# Optional: local semantic model (lazy loading for memory efficiency)
+# Models are loaded lazily on first use; the locks make sure concurrent first
+# requests don't load the same model twice.
+_nlp = None
+_NLP_LOCK = threading.Lock()
+
+# Only doc.ents is consumed, so everything but NER is excluded at load (never
+# built, never run). NER in the core pipelines carries its own internal tok2vec;
+# the shared tok2vec only feeds the tagger/parser, so it goes too.
+SPACY_UNUSED_PIPES = ["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "senter"]
+
+def _get_nlp():
+    """Lazy load the spaCy pipeline (download once if missing)"""
+    global _nlp
+    if _nlp is None:
+        with _NLP_LOCK:
+            if _nlp is None:
+                try:
+                    _nlp = spacy.load("en_core_web_sm", exclude=SPACY_UNUSED_PIPES)
+                except Exception:
+                    from spacy.cli import download
+                    download("en_core_web_sm")
+                    _nlp = spacy.load("en_core_web_sm", exclude=SPACY_UNUSED_PIPES)
+    return _nlp
+
+def _env_int(name: str, default: int) -> int:
+    try: return max(1, int(os.getenv(name, str(default))))
+    except ValueError: return default
+
+# Pages are fed through nlp.pipe in batches instead of one nlp(text) call each.
+SPACY_BATCH_SIZE = _env_int("CP_SPACY_BATCH", 32)
+# Worker processes for nlp.pipe (spaCy keeps output order). Forking pays off only
+# on large crawls, so it stays single-process unless CP_SPACY_PROCESSES is set.
+SPACY_PROCESSES = _env_int("CP_SPACY_PROCESSES", 1)
+# Long pages (directory/index pages) are fed to NER in pieces of at most this
+# many characters; this also keeps them under spaCy's nlp.max_length (1M).
+SPACY_CHUNK_CHARS = _env_int("CP_SPACY_CHUNK_CHARS", 50000)
+
+# Optional: local semantic model (lazy loading for memory efficiency).
+# MiniLM is already the distilled option; CP_ST_MODEL can point at a larger
+# model (e.g. all-mpnet-base-v2) when quality matters more than latency.
+ST_MODEL_NAME = os.getenv("CP_ST_MODEL", "all-MiniLM-L6-v2")
 _st_model = None
+_ST_LOCK = threading.Lock()
 
 def _get_st_model():
     """Lazy load SentenceTransformer model only when needed"""
     global _st_model
     if _st_model is None:
-        try:
-            from sentence_transformers import SentenceTransformer
-            _st_model = SentenceTransformer("all-MiniLM-L6-v2")
-        except Exception:
-            pass
+        with _ST_LOCK:
+            if _st_model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    model = SentenceTransformer(ST_MODEL_NAME)
+                    if model.device.type == "cpu" and os.getenv("CP_TORCH_THREADS", "").isdigit():
+                        # pin intra-op threads explicitly (torch defaults to the physical core count)
+                        import torch
+                        torch.set_num_threads(max(1, int(os.getenv("CP_TORCH_THREADS"))))
+                    if model.device.type == "cuda":
+                        # half precision on GPU; prefer BF16 (FP32 range, no overflow) where supported
+                        import torch
+                        # any op still in FP32 may use TF32 tensor cores on Ampere+
+                        torch.backends.cuda.matmul.allow_tf32 = True
+                        torch.backends.cudnn.allow_tf32 = True
+                        model = model.to(torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16)
+                    elif os.getenv("CP_ST_INT8", "0") == "1":
+                        # opt-in dynamic INT8 quantization of the Linear layers for CPU inference
+                        import torch
+                        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                    _st_model = model
+                except Exception:
+                    pass
     return _st_model
 
+def warm_models() -> None:
+    """Load spaCy and the semantic model up-front (used by the API startup hook)."""
+    _get_nlp()
+    _get_st_model()
+
 
 # ---------------- utilities ----------------
 def _norm_text(s: str) -> str:
@@ -40,28 +102,79 @@ def _norm_text(s: str) -> str:
 def _keywords_list(keywords: Iterable[str] | None) -> list[str]:
     return [k.strip().lower() for k in (keywords or []) if k and k.strip()]
 
+def _encode(model, texts: list[str]):
+    """
+    Encode on the model's device and return a tensor of L2-normalized rows,
+    so cosine similarity is a plain dot product (no CPU round-trip).
+    Runs under inference_mode, which also skips autograd version counters.
+    """
+    import torch
+    with torch.inference_mode():
+        return model.encode(
+            texts,
+            batch_size=64,
+            normalize_embeddings=True,
+            convert_to_tensor=True,
+            show_progress_bar=False,
+        )
+
+@lru_cache(maxsize=32)
+def _keyword_embedding(keywords: tuple[str, ...]):
+    """Keyword-side embedding; identical for every page of an extraction, so encode once."""
+    return _encode(_get_st_model(), ["; ".join(keywords)])[0]
+
 def _semantic_score(text: str, keywords: list[str]) -> float:
     """
     0..1 similarity between a text and the provided keywords.
     Uses SentenceTransformer if available; otherwise falls back to token overlap.
     """
-    if not text or not keywords:
-        return 0.0
-    
+    return _semantic_scores([text], keywords)[0]
+
+def _semantic_scores(texts: list[str], keywords: list[str]) -> list[float]:
+    """
+    Batched _semantic_score: encodes all texts (e.g. every candidate on a page)
+    in a single model call instead of one forward pass per text.
+    """
+    scores = [0.0] * len(texts)
+    if not keywords:
+        return scores
+    idx = [i for i, t in enumerate(texts) if t]
+    if not idx:
+        return scores
+
     model = _get_st_model()
     if model:
         try:
-            from sentence_transformers import util as st_util
-            t_emb = model.encode([text], normalize_embeddings=True)
-            k_emb = model.encode(["; ".join(keywords)], normalize_embeddings=True)
-            sim = float(st_util.cos_sim(t_emb, k_emb)[0][0])  # [-1, 1]
-            return max(0.0, min(1.0, (sim + 1.0) / 2.0))
+            t_emb = _encode(model, [texts[i] for i in idx])
+            k_emb = _keyword_embedding(tuple(keywords))
+            sims = (t_emb @ k_emb).float().tolist()  # cosine, [-1, 1]
+            for i, sim in zip(idx, sims):
+                scores[i] = max(0.0, min(1.0, (sim + 1.0) / 2.0))
+            return scores
         except Exception:
             pass
     # Fallback
-    tset = set(_norm_text(text).lower().split())
     kset = set(keywords)
-    return 0.0 if not tset or not kset else len(tset & kset) / max(1, len(kset))
+    for i in idx:
+        tset = set(_norm_text(texts[i]).lower().split())
+        scores[i] = 0.0 if not tset or not kset else len(tset & kset) / max(1, len(kset))
+    return scores
+
+def iter_pages(pages_path: str) -> Iterator[dict]:
+    """
+    Stream page records from a JSONL file one line at a time, so peak memory is
+    bounded by a single page instead of the whole crawl. Malformed lines are skipped.
+    """
+    with open(pages_path, "rb", buffering=1 << 16) as f:
+        for line in f:
+            if not line or line.isspace():
+                continue
+            try:
+                p = json_loads(line)
+            except Exception:
+                continue
+            if isinstance(p, dict):
+                yield p
 
 def _window(text: str, start: int, end: int, radius: int = 240) -> str:
     a = max(0, start - radius)
@@ -88,37 +201,47 @@ JOB_TITLE_RE = re.compile(
 
 ORG_HINT_RE = re.compile(r"\b(at|@|from|with)\s+([A-Z][A-Za-z0-9&\-\., ]{2,50})")
 
+# Contact details / passing year picked out of each candidate's context window
+PHONE_RE = re.compile(r"(\+?\d{1,3}[\s-]?)?(\(?\d{2,4}\)?[\s-]?)?\d{3,4}[\s-]?\d{3,4}")
+ADDRESS_RE = re.compile(r"\d{1,5} [A-Za-z0-9 .,'-]+(?:Street|St|Avenue|Ave|Road|Rd|Lane|Ln|Blvd|Boulevard|Campus|Building|Block|Sector|Colony|Area)", re.I)
+YEAR_RE = re.compile(r"(19|20)\d{2}")
+
 
-def _nearest_org(doc: spacy.tokens.Doc, start_char: int, end_char: int) -> str | None:
+def _nearest_org(orgs: list[tuple[int, int, str]], org_starts: list[int], start_char: int, end_char: int) -> str | None:
+    """
+    Closest ORG entity to the span. `orgs` is the page's ORG (start, end, text)
+    list in document order and `org_starts` its start offsets, so only the two
+    neighbours around the span need checking (the earlier one wins ties).
+    """
+    i = bisect_left(org_starts, end_char)
     nearest = None
     nearest_dist = 10**9
-    for ent in doc.ents:
-        if ent.label_ != "ORG":
-            continue
-        d = min(abs(ent.start_char - end_char), abs(start_char - ent.end_char))
+    for o_start, o_end, text in orgs[max(0, i - 1):i + 1]:
+        d = min(abs(o_start - end_char), abs(start_char - o_end))
         if d < nearest_dist:
             nearest_dist = d
-            nearest = ent.text
+            nearest = text
     return nearest
 
 
 # -------- generic candidate extraction ------
-def _extract_candidates_from_page(page_text: str, page_url: str) -> list[dict]:
+def _extract_candidates_from_page(page_text: str, page_url: str, ents: list[tuple[int, int, str, str]] | None = None) -> list[dict]:
     """
     Build PERSON candidates with nearby title guess + org + rich snippet.
+    `ents` holds the page's (start_char, end_char, label, text) entities in
+    document order; pass it when the page was already parsed (e.g. via nlp.pipe).
     """
-    doc = nlp(page_text)
+    if ents is None:
+        ents = [(e.start_char, e.end_char, e.label_, e.text) for e in _get_nlp()(page_text).ents]
     out: list[dict] = []
+    orgs = [(start, end, text) for start, end, label, text in ents if label == "ORG"]
+    org_starts = [o[0] for o in orgs]
 
-    phone_re = re.compile(r"(\+?\d{1,3}[\s-]?)?(\(?\d{2,4}\)?[\s-]?)?\d{3,4}[\s-]?\d{3,4}")
-    address_re = re.compile(r"\d{1,5} [A-Za-z0-9 .,'-]+(?:Street|St|Avenue|Ave|Road|Rd|Lane|Ln|Blvd|Boulevard|Campus|Building|Block|Sector|Colony|Area)", re.I)
-    year_re = re.compile(r"(19|20)\d{2}")
-
-    for ent in doc.ents:
-        if ent.label_ != "PERSON":
+    for start_char, end_char, label, ent_text in ents:
+        if label != "PERSON":
             continue
 
-        ctx = _window(page_text, ent.start_char, ent.end_char, radius=260)
+        ctx = _window(page_text, start_char, end_char, radius=260)
 
         # Title guess from nearby TitleCase or explicit job phrases
         title_guess = None
@@ -128,14 +251,14 @@ def _extract_candidates_from_page(page_text: str, page_url: str) -> list[dict]:
         else:
             for m in TITLE_NEAR_RE.finditer(ctx):
                 frag = m.group(1).strip()
-                if ent.text in frag:
+                if ent_text in frag:
                     continue
                 if 2 <= len(frag.split()) <= 7:
                     title_guess = frag
                     break
 
         # Organization (spaCy ORG nearest or "at/@" pattern)
-        org_guess = _nearest_org(doc, ent.start_char, ent.end_char)
+        org_guess = _nearest_org(orgs, org_starts, start_char, end_char)
         if not org_guess:
             m_org = ORG_HINT_RE.search(ctx)
             if m_org:
@@ -147,18 +270,18 @@ def _extract_candidates_from_page(page_text: str, page_url: str) -> list[dict]:
         phone = None
         address = None
         passing_year = None
-        m_phone = phone_re.search(ctx)
+        m_phone = PHONE_RE.search(ctx)
         if m_phone:
             phone = m_phone.group(0)
-        m_addr = address_re.search(ctx)
+        m_addr = ADDRESS_RE.search(ctx)
         if m_addr:
             address = m_addr.group(0)
-        m_year = year_re.search(ctx)
+        m_year = YEAR_RE.search(ctx)
         if m_year:
             passing_year = m_year.group(0)
 
         out.append({
-            "name": ent.text.strip(),
+            "name": ent_text.strip(),
             "title": title_guess,
             "org": org_guess,
             "context_url": page_url,
@@ -175,24 +298,104 @@ def _extract_candidates_from_page(page_text: str, page_url: str) -> list[dict]:
     return out
 
 
+# Candidates depend only on the page text, not on keywords. Keep the last full
+# pass keyed on the pages file's identity so re-extracting the same crawl with
+# different keywords skips spaCy entirely.
+_CANDIDATE_CACHE: dict = {"key": None, "pages": []}
+
+def _pages_key(pages_path: str) -> tuple | None:
+    try:
+        st = os.stat(pages_path)
+    except OSError:
+        return None
+    return (os.path.abspath(pages_path), st.st_mtime_ns, st.st_size)
+
+def _chunk_text(text: str, max_chars: int = SPACY_CHUNK_CHARS) -> Iterator[tuple[int, str]]:
+    """
+    Yield (offset, chunk) slices of at most max_chars that concatenate back to
+    `text`. Cuts after a sentence end where possible (else at a space) so
+    entities are rarely split across chunks.
+    """
+    start = 0
+    while len(text) - start > max_chars:
+        limit = start + max_chars
+        cut = text.rfind(". ", start, limit) + 1
+        if cut <= start:
+            cut = text.rfind(" ", start, limit)
+        if cut <= start:
+            cut = limit
+        yield start, text[start:cut]
+        start = cut
+    yield start, text[start:]
+
+def _page_chunks(pages_path: str) -> Iterator[tuple[str, tuple[str, int, bool]]]:
+    """(chunk, (url, offset, is_last_chunk)) pairs for nlp.pipe(as_tuples=True)."""
+    for p in iter_pages(pages_path):
+        url = p.get("url") or ""
+        chunks = list(_chunk_text(p.get("text") or ""))
+        for i, (offset, chunk) in enumerate(chunks):
+            yield chunk, (url, offset, i == len(chunks) - 1)
+
+def _iter_page_candidates(pages_path: str) -> Iterator[tuple[str, list[dict] | None]]:
+    """
+    Yield (url, candidates) per page; candidates is None for pages without text.
+    Served from _CANDIDATE_CACHE when the pages file is unchanged.
+    """
+    key = _pages_key(pages_path)
+    if key is not None and key == _CANDIDATE_CACHE["key"]:
+        for url, cands in _CANDIDATE_CACHE["pages"]:
+            yield url, None if cands is None else [dict(c) for c in cands]
+        return
+
+    collected: list[tuple[str, list[dict] | None]] = []
+    # Stream pages through spaCy in batches; nlp.pipe pulls lazily, so memory
+    # stays bounded by one batch and results still arrive page by page.
+    # Chunks come back in order, so a page is complete at its last chunk.
+    docs = _get_nlp().pipe(
+        _page_chunks(pages_path),
+        as_tuples=True,
+        batch_size=SPACY_BATCH_SIZE,
+        n_process=SPACY_PROCESSES,
+    )
+    parts: list[str] = []
+    ents: list[tuple[int, int, str, str]] = []
+    for doc, (url, offset, last) in docs:
+        parts.append(doc.text)
+        ents.extend((e.start_char + offset, e.end_char + offset, e.label_, e.text) for e in doc.ents)
+        if not last:
+            continue
+        text = parts[0] if len(parts) == 1 else "".join(parts)
+        cands = _extract_candidates_from_page(text, url, ents) if text else None
+        parts, ents = [], []
+        collected.append((url, cands))
+        yield url, None if cands is None else [dict(c) for c in cands]
+    # only a complete pass is cached (a cancelled run closes the generator early)
+    if key is not None and key == _pages_key(pages_path):
+        _CANDIDATE_CACHE.update(key=key, pages=collected)
+
+
 # ----------------- scoring ------------------
+PEOPLE_URL_RE = re.compile(r"(team|people|staff|mentor|leadership|about|profile|careers)", re.I)
+
+@lru_cache(maxsize=4096)
 def _page_title_boost(url: str) -> float:
-    # cheap heuristic using URL path hints
-    return 0.15 if re.search(r"(team|people|staff|mentor|leadership|about|profile|careers)", url, re.I) else 0.0
+    # cheap heuristic using URL path hints; every candidate on a page shares the URL
+    return 0.15 if PEOPLE_URL_RE.search(url) else 0.0
 
-def _score_candidate(c: dict, keywords: list[str]) -> float:
+def _sem_text(c: dict) -> str:
+    return f"{c.get('title') or ''}. {c.get('snippet') or ''}".strip()
+
+def _score_candidate(c: dict, keywords: list[str], sem: float | None = None) -> float:
     """
     Score (0..1) using:
-      - semantic similarity to keywords (if any)
+      - semantic similarity to keywords (if any); pass `sem` if already computed
       - structural cues (title/org presence, snippet richness)
       - small URL/section boost for team/people pages
     """
-    title = c.get("title") or ""
-    snippet = c.get("snippet") or ""
     url = c.get("context_url") or ""
-    text_for_sem = f"{title}. {snippet}".strip()
 
-    sem = _semantic_score(text_for_sem, keywords) if keywords else 0.0
+    if sem is None:
+        sem = _semantic_score(_sem_text(c), keywords) if keywords else 0.0
     feats = c.get("_features", {})
     has_title = float(feats.get("has_title", 0.0))
     has_org = float(feats.get("has_org", 0.0))
@@ -219,8 +422,9 @@ def extract_entities(
     Flexible extractor for any site + any keyword(s) (or none).
     Reads JSONL from pages_path; incrementally writes JSON array to entities_path.
 
-    Behavior change: entities_path is updated after each processed page so that the
-    frontend can poll /api/results and see results grow in real time.
+    Behavior change: entities_path is updated as pages are processed (at most once a
+    second, or every 10 pages) so that the frontend can poll /api/results and see
+    results grow in real time.
     """
     kw = _keywords_list(keywords)
 
@@ -253,47 +457,49 @@ def extract_entities(
             for c in sorted(best.values(), key=lambda x: x["_score"], reverse=True)
         ]
         try:
-            with open(entities_path, "w", encoding="utf-8") as f:
-                json.dump(entities_list, f, ensure_ascii=False, indent=2)
+            # write-then-rename so /api/results never reads a half-written file
+            tmp = entities_path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(json_bytes(entities_list))
+            os.replace(tmp, entities_path)
         except Exception:
             # ignore transient IO errors and continue
             pass
         return entities_list
 
-    # Stream pages one by one
-    with open(pages_path, "r", encoding="utf-8") as f:
-        for line in f:
-            # cooperative cancellation
-            if cancel_path and os.path.exists(cancel_path):
-                break
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                p = json.loads(line)
-            except Exception:
-                continue
+    # Stream pages one by one; partial results are persisted at most once a
+    # second (or every 10 pages) instead of re-sorting and rewriting per page.
+    last_emit = time.monotonic()
+    pages_since_emit = 0
+    for url, cands in _iter_page_candidates(pages_path):
+        # cooperative cancellation
+        if cancel_path and os.path.exists(cancel_path):
+            break
+
+        if not first_page_url and url:
+            first_page_url = url
+        if cands is None:
+            pages_scanned += 1
+            continue
 
-            txt = p.get("text") or ""
-            url = p.get("url") or ""
-            if not first_page_url and url:
-                first_page_url = url
-            if not txt:
-                pages_scanned += 1
+        # semantic scores are computed in one batch per page and double as the relevance gate;
+        # without keywords there is nothing to compare against, so skip building the texts
+        sems = _semantic_scores([_sem_text(c) for c in cands], kw) if kw else [0.0] * len(cands)
+        for c, sem in zip(cands, sems):
+            if kw and sem < 0.15:
                 continue
-
-            # build candidates for this page
-            for c in _extract_candidates_from_page(txt, url):
-                c["_score"] = _score_candidate(c, kw)
-                if kw and _semantic_score((c.get("title") or "") + " " + (c.get("snippet") or ""), kw) < 0.15:
-                    continue
-                key = (c["name"].lower(), (c.get("title") or "").lower(), c.get("context_url") or "")
-                if key not in best or c["_score"] > best[key]["_score"]:
-                    best[key] = c
-
-            pages_scanned += 1
-            # Persist after each page to support real-time UI
+            c["_score"] = _score_candidate(c, kw, sem)
+            key = (c["name"].lower(), (c.get("title") or "").lower(), c.get("context_url") or "")
+            if key not in best or c["_score"] > best[key]["_score"]:
+                best[key] = c
+
+        pages_scanned += 1
+        pages_since_emit += 1
+        # Persist periodically to support real-time UI
+        if pages_since_emit >= 10 or time.monotonic() - last_emit >= 1.0:
             _emit_entities()
+            last_emit = time.monotonic()
+            pages_since_emit = 0
 
     # Final materialization
     entities = _emit_entities()
@@ -168,15 +168,22 @@ const Results = () => {
     };
   }, [crawlConfig, lastRun, apiReady]);
 
+  // Lowercased string fields per entity, rebuilt only when the results change
+  // (not on every keystroke in the search box)
+  const searchIndex: string[][] = useMemo(
+    () => entities.map((e) =>
+      Object.values(e).filter((v): v is string => typeof v === "string").map((v) => v.toLowerCase())
+    ),
+    [entities]
+  );
+
   // Filtered view matches table + export
   const filtered: Record<string, any>[] = useMemo(() => {
     if (!entities || entities.length === 0) return [];
-    return entities.filter((e) => {
-      return Object.values(e).some(
-        v => (typeof v === "string" ? v.toLowerCase().includes(searchQuery.toLowerCase()) : false)
-      );
-    });
-  }, [entities, searchQuery]);
+    const q = searchQuery.toLowerCase();
+    if (!q) return entities;
+    return entities.filter((_, i) => searchIndex[i].some((v) => v.includes(q)));
+  }, [entities, searchIndex, searchQuery]);
 
   const exportEntities = (format: "csv" | "json" = "csv") => {
     if (!filtered || filtered.length === 0) {